@@ -3,8 +3,15 @@ import sys
 import time
 import struct
 import csv
-import re
-from typing import Dict, List, Tuple, Optional, Any
+import heapq
+import mmap
+from typing import Dict, List, Tuple, Optional, Any, TextIO, Union
+
+# Precompiled catalog integer format (4-byte unsigned, little-endian)
+_UINT = struct.Struct('<I')
+
+# Precompiled page header format: page_number(4) + num_records(4) + bitmap(4)
+_HDR = struct.Struct('<III')
 
 class DuneArchive:
     def __init__(self):
@@ -16,194 +23,256 @@ class DuneArchive:
         self.MAX_TYPE_NAME_LENGTH = 12 # at least 12 characters
         self.MAX_FIELD_NAME_LENGTH = 20 # at least 20 characters
         self.MAX_STRING_LENGTH = 100 # decided to include up to 100 characters
+        self._full_mask = (1 << self.MAX_RECORDS_PER_PAGE) - 1 # page bitmap with every slot occupied
         
         # System catalog
         self.catalog = {}  # type_name -> type_info
         self.catalog_file = "catalog.dat"
+        self._serializers = {}  # type_name -> generated record serializer
+        self._deserializers = {}  # type_name -> generated record deserializer
+        
+        # Open data files
+        self._fds = {}  # type_name -> file descriptor of the data file
+        self._mmaps = {}  # type_name -> memory map of the data file
+        
+        # In-memory record lookup, built lazily per type
+        self._pk_index = {}  # type_name -> {primary_key: (page_number, slot)}
+        self._free_slots = {}  # type_name -> heap of free (page_number, slot)
+        
+        # Operation log, kept open and buffered for the life of the archive
+        self._log_fh = open('log.csv', 'a', newline='', buffering=1 << 16)
+        self._log_writer = csv.writer(self._log_fh)
         
         # Load existing catalog
         self._load_catalog()
     
+    def close(self):
+        # Flush the operation log and the data files, then release the memory maps and file descriptors
+        if self._log_fh is not None:
+            self._log_fh.close()
+            self._log_fh = None
+        try:
+            # Write the dirty pages back first (closing a map alone does not)
+            for mm in self._mmaps.values():
+                mm.flush()
+            for mm in self._mmaps.values():
+                try:
+                    mm.close()
+                except BufferError:
+                    # A page view is still referenced (e.g. by the frame of an in-flight exception);
+                    # the map is unmapped once the last view is released
+                    pass
+        finally:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._mmaps.clear()
+            self._fds.clear()
+    
+    def __del__(self):
+        if hasattr(self, '_log_fh'):
+            self.close()
+    
     def _load_catalog(self):
         # Load the system catalog
         if os.path.exists(self.catalog_file):
             try:
                 with open(self.catalog_file, 'rb') as f:
-                    data = f.read()
-                    if data:
-                        # Simple serialization: each type is stored as:
-                        # type_name_length(4) + type_name + num_fields(4) + primary_key_order(4) + 
-                        # for each field: field_name_length(4) + field_name + field_type_length(4) + field_type
-                        offset = 0
-                        while offset < len(data):
-                            # Read type name
-                            type_name_len = struct.unpack('I', data[offset:offset+4])[0]
-                            offset += 4
-                            type_name = data[offset:offset+type_name_len].decode('utf-8')
-                            offset += type_name_len
-                            
-                            # Read number of fields and primary key order
-                            num_fields = struct.unpack('I', data[offset:offset+4])[0]
-                            offset += 4
-                            primary_key_order = struct.unpack('I', data[offset:offset+4])[0]
-                            offset += 4
-                            
-                            # Read fields (name, type)
-                            fields = []
-                            for i in range(num_fields):
-                                field_name_len = struct.unpack('I', data[offset:offset+4])[0]
-                                offset += 4
-                                field_name = data[offset:offset+field_name_len].decode('utf-8')
-                                offset += field_name_len
-                                
-                                field_type_len = struct.unpack('I', data[offset:offset+4])[0]
-                                offset += 4
-                                field_type = data[offset:offset+field_type_len].decode('utf-8')
-                                offset += field_type_len
-                                
-                                fields.append((field_name, field_type))
-                            
-                            # Add to catalog
-                            self.catalog[type_name] = {
-                                'fields': fields,
-                                'primary_key_order': primary_key_order,
-                                'record_size': self._calculate_record_size(fields)
-                            }
+                    # Map the file instead of reading it into memory (an empty file cannot be mapped)
+                    if os.fstat(f.fileno()).st_size > 0:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                            self._parse_catalog(data)
             except:
                 pass 
     
+    def _parse_catalog(self, data: mmap.mmap):
+        # Parse the catalog entries from the mapped catalog file
+        # Simple serialization: each type is stored as:
+        # type_name_length(4) + type_name + num_fields(4) + primary_key_order(4) + 
+        # for each field: field_name_length(4) + field_name + field_type_length(4) + field_type
+        offset = 0
+        while offset < len(data):
+            # Read type name
+            type_name_len = _UINT.unpack_from(data, offset)[0]
+            offset += 4
+            type_name = data[offset:offset+type_name_len].decode('ascii')
+            offset += type_name_len
+            
+            # Read number of fields and primary key order
+            num_fields = _UINT.unpack_from(data, offset)[0]
+            offset += 4
+            primary_key_order = _UINT.unpack_from(data, offset)[0]
+            offset += 4
+            
+            # Read fields (name, type)
+            fields = []
+            for i in range(num_fields):
+                field_name_len = _UINT.unpack_from(data, offset)[0]
+                offset += 4
+                field_name = data[offset:offset+field_name_len].decode('ascii')
+                offset += field_name_len
+                
+                field_type_len = _UINT.unpack_from(data, offset)[0]
+                offset += 4
+                field_type = data[offset:offset+field_type_len].decode('ascii')
+                offset += field_type_len
+                
+                fields.append((field_name, field_type))
+            
+            # Add to catalog
+            self._compile_record_codec(type_name, fields)
+            self.catalog[type_name] = {
+                'fields': fields,
+                'primary_key_order': primary_key_order,
+                'record_size': self._calculate_record_size(fields)
+            }
+    
     def _save_catalog(self):
         # Save the system catalog
+        # Encode all names first so the whole catalog can be packed into one buffer
+        entries = []
+        size = 0
+        for type_name, type_info in self.catalog.items():
+            type_name_bytes = type_name.encode('ascii')
+            fields = [(field_name.encode('ascii'), field_type.encode('ascii'))
+                      for field_name, field_type in type_info['fields']]
+            entries.append((type_name_bytes, type_info['primary_key_order'], fields))
+            size += 12 + len(type_name_bytes)
+            for field_name_bytes, field_type_bytes in fields:
+                size += 8 + len(field_name_bytes) + len(field_type_bytes)
+        
+        data = bytearray(size)
+        offset = 0
+        for type_name_bytes, primary_key_order, fields in entries:
+            # Write type name
+            _UINT.pack_into(data, offset, len(type_name_bytes))
+            offset += 4
+            data[offset:offset+len(type_name_bytes)] = type_name_bytes
+            offset += len(type_name_bytes)
+            
+            # Write number of fields and primary key order
+            _UINT.pack_into(data, offset, len(fields))
+            offset += 4
+            _UINT.pack_into(data, offset, primary_key_order)
+            offset += 4
+            
+            # Write fields
+            for field_name_bytes, field_type_bytes in fields:
+                _UINT.pack_into(data, offset, len(field_name_bytes))
+                offset += 4
+                data[offset:offset+len(field_name_bytes)] = field_name_bytes
+                offset += len(field_name_bytes)
+                _UINT.pack_into(data, offset, len(field_type_bytes))
+                offset += 4
+                data[offset:offset+len(field_type_bytes)] = field_type_bytes
+                offset += len(field_type_bytes)
+        
         with open(self.catalog_file, 'wb') as f:
-            for type_name, type_info in self.catalog.items():
-                # Write type name
-                type_name_bytes = type_name.encode('utf-8')
-                f.write(struct.pack('I', len(type_name_bytes)))
-                f.write(type_name_bytes)
-                
-                # Write number of fields and primary key order
-                f.write(struct.pack('I', len(type_info['fields'])))
-                f.write(struct.pack('I', type_info['primary_key_order']))
-                
-                # Write fields
-                for field_name, field_type in type_info['fields']:
-                    field_name_bytes = field_name.encode('utf-8')
-                    field_type_bytes = field_type.encode('utf-8')
-                    
-                    f.write(struct.pack('I', len(field_name_bytes)))
-                    f.write(field_name_bytes)
-                    f.write(struct.pack('I', len(field_type_bytes)))
-                    f.write(field_type_bytes)
+            f.write(data)
+    
+    def _record_format(self, fields: List[Tuple[str, str]]) -> str:
+        # Build the struct format of a record: validity flag (1 byte) followed by the fields in order
+        # Little-endian with no alignment padding, so the layout matches the packed on-disk format
+        fmt = '<B'
+        for field_name, field_type in fields:
+            if field_type == 'int':
+                fmt += 'i'  # 4 bytes for integer
+            elif field_type == 'str':
+                fmt += f'{self.MAX_STRING_LENGTH}s'  # fixed size for strings
+        return fmt
     
     def _calculate_record_size(self, fields: List[Tuple[str, str]]) -> int:
         # Calculate the fixed size of a record based on its fields
-        size = 1  # validity flag (1 byte)
-        for field_name, field_type in fields:
+        return struct.calcsize(self._record_format(fields))
+    
+    def _compile_record_codec(self, type_name: str, fields: List[Tuple[str, str]]):
+        # Generate a serializer and a deserializer specialized to the fields of a type
+        # The field order and conversions are inlined, so a record is packed/unpacked in a single call
+        # with no per-field loop (only field indices and constants end up in the generated source)
+        pack_args = ['1']  # validity flag (1 = valid)
+        unpacked_values = []
+        for i, (field_name, field_type) in enumerate(fields):
             if field_type == 'int':
-                size += 4  # 4 bytes for integer
+                pack_args.append(f'int(values[{i}])')
+                unpacked_values.append(f'str(v[{i + 1}])')
             elif field_type == 'str':
-                size += self.MAX_STRING_LENGTH  # fixed size for strings
-        return size
+                # Values are validated to be ASCII, so encode first and truncate the bytes to ensure it fits
+                # (the struct pads it with null bytes to the fixed length)
+                pack_args.append(f"values[{i}].encode('ascii')[:{self.MAX_STRING_LENGTH - 1}]")
+                unpacked_values.append(f"v[{i + 1}].rstrip(b'\\0').decode('ascii')")
+        
+        source = (
+            "def serialize(buffer, offset, values):\n"
+            f"    pack_into(buffer, offset, {', '.join(pack_args)})\n"
+            "def deserialize(buffer, offset):\n"
+            "    v = unpack_from(buffer, offset)\n"
+            "    if v[0] == 0:\n"
+            "        return None\n"
+            f"    return [{', '.join(unpacked_values)}]\n"
+        )
+        record_struct = struct.Struct(self._record_format(fields))
+        namespace = {'pack_into': record_struct.pack_into, 'unpack_from': record_struct.unpack_from}
+        exec(source, namespace)
+        
+        self._serializers[type_name] = namespace['serialize']
+        self._deserializers[type_name] = namespace['deserialize']
     
     def _get_data_file_path(self, type_name: str) -> str:
         # Get the data file path for a given type
         return f"{type_name}.dat"
     
-    def _create_page_header(self, page_number: int, num_records: int, bitmap: int) -> bytes:
-        # Create a page header (12 bytes)
-        # page_number(4) + num_records(4) + bitmap(4)
-        return struct.pack('III', page_number, num_records, bitmap)
-    
     def _parse_page_header(self, header_data: bytes) -> Tuple[int, int, int]:
         # Parse page header
-        return struct.unpack('III', header_data[:12])
+        return _HDR.unpack_from(header_data, 0)
     
-    def _serialize_record(self, type_name: str, values: List[str]) -> bytes:
-        # Serialize a record to bytes
-        type_info = self.catalog[type_name]
-        fields = type_info['fields']
-        
-        # Start with validity flag (1 = valid)
-        record_data = struct.pack('B', 1)
-        
-        for i, (field_name, field_type) in enumerate(fields):
-            if field_type == 'int':
-                value = int(values[i])
-                record_data += struct.pack('i', value)
-            elif field_type == 'str':
-                value = values[i][:self.MAX_STRING_LENGTH-1]  # Ensure it fits
-                # Pad string to fixed length
-                padded_value = value.ljust(self.MAX_STRING_LENGTH, '\0')
-                record_data += padded_value.encode('utf-8')
-        
-        return record_data
+    def _serialize_record(self, type_name: str, values: List[str],
+                          buffer: Union[bytearray, memoryview], offset: int):
+        # Serialize a record into a writable buffer (e.g. a page view) at the given offset
+        self._serializers[type_name](buffer, offset, values)
     
-    def _deserialize_record(self, type_name: str, record_data: bytes) -> List[str]:
-        # Deserialize a record from bytes
-        type_info = self.catalog[type_name]
-        fields = type_info['fields']
+    def _deserialize_record(self, type_name: str, record_data: Union[bytes, memoryview],
+                            offset: int = 0) -> Optional[List[str]]:
+        # Deserialize a record stored at the given offset of a buffer (e.g. a page view)
+        # Returns None if the record's validity flag is cleared
+        return self._deserializers[type_name](record_data, offset)
+    
+    def _get_mmap(self, type_name: str, create: bool = False) -> Optional[mmap.mmap]:
+        # Get the memory map of a data file, opening it on first access
+        mm = self._mmaps.get(type_name)
+        if mm is not None:
+            return mm
         
-        # Check validity flag
-        validity = struct.unpack('B', record_data[:1])[0]
-        if validity == 0:
-            return None  # Invalid record
+        file_path = self._get_data_file_path(type_name)
+        if not create and not os.path.exists(file_path):
+            return None
         
-        values = []
-        offset = 1  # Skip validity flag
+        fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o666)
         
-        for field_name, field_type in fields:
-            if field_type == 'int':
-                value = struct.unpack('i', record_data[offset:offset+4])[0]
-                values.append(str(value))
-                offset += 4
-            elif field_type == 'str':
-                value_bytes = record_data[offset:offset+self.MAX_STRING_LENGTH]
-                value = value_bytes.decode('utf-8').rstrip('\0')
-                values.append(value)
-                offset += self.MAX_STRING_LENGTH
+        # Grow the file to hold all pages once so it never needs to be extended
+        # (a metadata-only operation, the zero pages are not written out)
+        file_size = self.MAX_PAGES_PER_FILE * self.PAGE_SIZE
+        if os.fstat(fd).st_size < file_size:
+            os.ftruncate(fd, file_size)
         
-        return values
+        mm = mmap.mmap(fd, 0)
+        self._fds[type_name] = fd
+        self._mmaps[type_name] = mm
+        return mm
     
-    def _load_page(self, type_name: str, page_number: int) -> Tuple[Optional[bytes], int, int]:
-        # Load a specific page from file
-        file_path = self._get_data_file_path(type_name)
-        if not os.path.exists(file_path):
-            return None, 0, 0
-        
-        with open(file_path, 'rb') as f:
-            # Seek to the page
-            page_offset = page_number * self.PAGE_SIZE
-            f.seek(page_offset)
-            
-            page_data = f.read(self.PAGE_SIZE)
-            if len(page_data) < 12:  # Not enough data for header
-                return None, 0, 0
-            
-            # Parse header
-            page_num, num_records, bitmap = self._parse_page_header(page_data)
-            return page_data, num_records, bitmap
-    
-    def _save_page(self, type_name: str, page_number: int, page_data: bytes):
-        # Save a page to file
-        file_path = self._get_data_file_path(type_name)
-        
-        # Create file if it doesn't exist or extend it if necessary
-        if not os.path.exists(file_path):
-            with open(file_path, 'wb') as f:
-                f.write(b'\0' * ((page_number + 1) * self.PAGE_SIZE))
-        else:
-            # Check if we need to extend the file
-            current_size = os.path.getsize(file_path)
-            required_size = (page_number + 1) * self.PAGE_SIZE
-            if current_size < required_size:
-                with open(file_path, 'ab') as f:
-                    f.write(b'\0' * (required_size - current_size))
-        
-        # Write the page
-        with open(file_path, 'r+b') as f:
-            page_offset = page_number * self.PAGE_SIZE
-            f.seek(page_offset)
-            f.write(page_data)
+    def _load_page(self, type_name: str, page_number: int, create: bool = False) -> Tuple[Optional[memoryview], int, int, int]:
+        # Load a specific page from file, creating the file if requested
+        mm = self._get_mmap(type_name, create)
+        if mm is None:
+            return None, 0, 0, 0
+        
+        # View the page directly in the memory map (no read, no copy)
+        # The view is writable: changes go to the shared mapping, and the dirty pages are written
+        # back to the file by the kernel or at the latest by the flush in close()
+        page_offset = page_number * self.PAGE_SIZE
+        page_data = memoryview(mm)[page_offset:page_offset + self.PAGE_SIZE]
+        
+        # Parse header
+        page_num, num_records, bitmap = self._parse_page_header(page_data)
+        return page_data, page_num, num_records, bitmap
     
     def _find_primary_key_value(self, type_name: str, values: List[str]) -> str:
         # Extract the primary key value from record values
@@ -216,20 +285,18 @@ class DuneArchive:
         timestamp = int(time.time()) 
         status = "success" if success else "failure"
         
-        # Append to log file
-        with open('log.csv', 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([f"{timestamp}", f" {operation}", f" {status}"])
+        # Append to log file (buffered, written out on close)
+        self._log_writer.writerow([f"{timestamp}", f" {operation}", f" {status}"])
     
     def _is_valid_name(self, name: str) -> bool:
         # Validate type names and field names
         # Must contain at least one letter and only letters/digits
-        return bool(re.match(r'^(?=.*[a-zA-Z])[a-zA-Z0-9]+$', name))
+        return name.isascii() and name.isalnum() and not name.isdigit()
 
     def _is_valid_string_value(self, value: str) -> bool:
         # Validate string field values
         # Only letters and digits allowed
-        return bool(re.match(r'^[a-zA-Z0-9]+$', value))
+        return value.isascii() and value.isalnum()
 
     def _is_valid_int_value(self, value: str) -> bool:
         # Validate integer field values
@@ -278,6 +345,7 @@ class DuneArchive:
             return False
         
         # Add to catalog
+        self._compile_record_codec(type_name, fields)
         self.catalog[type_name] = {
             'fields': fields,
             'primary_key_order': primary_key_order,
@@ -311,84 +379,100 @@ class DuneArchive:
         primary_key_value = self._find_primary_key_value(type_name, values)
         
         # Check if record with this primary key already exists
-        if self._search_record_internal(type_name, primary_key_value) is not None:
+        # (compare against the key as it is stored: ints are normalized, strings truncated)
+        if type_info['fields'][type_info['primary_key_order'] - 1][1] == 'int':
+            primary_key_value = str(int(primary_key_value))
+        else:
+            primary_key_value = primary_key_value[:self.MAX_STRING_LENGTH-1]
+        
+        pk_index = self._get_pk_index(type_name)
+        if primary_key_value in pk_index:
             return False
         
-        # Serialize the record
-        record_data = self._serialize_record(type_name, values)
+        # Take the lowest free slot
+        free_slots = self._free_slots[type_name]
+        if not free_slots:
+            return False
+        page_number, free_slot = free_slots[0]
+        
+        page_data, page_num, num_records, bitmap = self._load_page(type_name, page_number, create=True)
+        
+        # Serialize the record straight into this slot
+        record_offset = 12 + free_slot * type_info['record_size']
+        self._serialize_record(type_name, values, page_data, record_offset)
+        heapq.heappop(free_slots)
+        
+        # Update bitmap and header
+        bitmap = bitmap | (1 << free_slot) # Set the bit at the free slot to 1
+        num_records += 1
+        _HDR.pack_into(page_data, 0, page_number, num_records, bitmap)
+        pk_index[primary_key_value] = (page_number, free_slot)
+        return True
+    
+    def _get_pk_index(self, type_name: str) -> Dict[str, Tuple[int, int]]:
+        # Get the primary key index of a type (primary key -> (page, slot))
+        # Built on first access with a single scan of the data file, which also collects the free slots
+        pk_index = self._pk_index.get(type_name)
+        if pk_index is not None:
+            return pk_index
+        
+        type_info = self.catalog[type_name]
+        primary_key_index = type_info['primary_key_order'] - 1
         
-        # Find a page with free space or create a new one
-        page_number = 0
-        while True:
-            page_data, num_records, bitmap = self._load_page(type_name, page_number)
+        # Ask the OS to read the whole file ahead, so it is not faulted in one page at a time during the scan
+        mm = self._get_mmap(type_name)
+        if mm is not None and hasattr(mmap, 'MADV_WILLNEED'):
+            mm.madvise(mmap.MADV_WILLNEED)
+        
+        pk_index = {}
+        free_slots = []
+        for page_number in range(self.MAX_PAGES_PER_FILE):
+            page_data, page_num, num_records, bitmap = self._load_page(type_name, page_number)
             
-            if page_data is None:
-                # Create new page
-                bitmap = 0
-                num_records = 0
-                page_data = bytearray(self.PAGE_SIZE)
-                # Initialize with header
-                header = self._create_page_header(page_number, 0, 0)
-                page_data[:12] = header
-            else:
-                page_data = bytearray(page_data)
+            # Pages are filled lowest first and get their number stamped in the header when first written,
+            # so the first unstamped page (or a missing file) marks the end of the used part of the file
+            if page_data is None or (page_number > 0 and page_num == 0):
+                free_slots.extend((unused_page, slot)
+                                  for unused_page in range(page_number, self.MAX_PAGES_PER_FILE)
+                                  for slot in range(self.MAX_RECORDS_PER_PAGE))
+                break
             
-            # Find free slot
-            free_slot = None
-            for slot in range(self.MAX_RECORDS_PER_PAGE):
-                if not (bitmap & (1 << slot)): # If the slot is not occupied (bitmap is a bitmask)
-                    free_slot = slot
-                    break
+            # Collect the free slots, lowest first (x & -x isolates the lowest set bit)
+            free = ~bitmap & self._full_mask
+            while free:
+                free_slots.append((page_number, (free & -free).bit_length() - 1))
+                free &= free - 1
             
-            if free_slot is not None:
-                # Add record to this slot
-                record_offset = 12 + free_slot * type_info['record_size']
-                page_data[record_offset:record_offset + len(record_data)] = record_data
-                
-                # Update bitmap and header
-                bitmap = bitmap | (1 << free_slot) # Set the bit at the free slot to 1
-                num_records += 1
-                header = self._create_page_header(page_number, num_records, bitmap)
-                page_data[:12] = header
+            # Index the occupied slots
+            occupied = bitmap & self._full_mask
+            while occupied:
+                slot = (occupied & -occupied).bit_length() - 1
+                occupied &= occupied - 1
                 
-                # Save page
-                self._save_page(type_name, page_number, bytes(page_data))
-                return True
-            
-            page_number += 1
-            if page_number >= self.MAX_PAGES_PER_FILE:
-                return False
+                record_offset = 12 + slot * type_info['record_size'] # Calculate the offset of the record (12 bytes for the header)
+                values = self._deserialize_record(type_name, page_data, record_offset)
+                if values:
+                    pk_index.setdefault(values[primary_key_index], (page_number, slot))
+        
+        # Slots are collected in (page, slot) order, so the list is already a valid heap
+        self._pk_index[type_name] = pk_index
+        self._free_slots[type_name] = free_slots
+        return pk_index
     
     def _search_record_internal(self, type_name: str, primary_key: str) -> Optional[List[str]]:
         # Internal method to search for a record
         if type_name not in self.catalog:
             return None
         
-        type_info = self.catalog[type_name]
-        primary_key_index = type_info['primary_key_order'] - 1
+        location = self._get_pk_index(type_name).get(primary_key)
+        if location is None:
+            return None
         
-        # Search through all pages
-        page_number = 0
-        while page_number < self.MAX_PAGES_PER_FILE:
-            page_data, num_records, bitmap = self._load_page(type_name, page_number)
-            
-            if page_data is None or num_records == 0:
-                page_number += 1
-                continue
-            
-            # Check each slot
-            for slot in range(self.MAX_RECORDS_PER_PAGE):
-                if bitmap & (1 << slot):  # If the slot is not occupied (bitmap is a bitmask)
-                    record_offset = 12 + slot * type_info['record_size'] # Calculate the offset of the record (12 bytes for the header)
-                    record_data = page_data[record_offset:record_offset + type_info['record_size']]
-                    
-                    values = self._deserialize_record(type_name, record_data)
-                    if values and values[primary_key_index] == primary_key:
-                        return values
-            
-            page_number += 1
+        page_number, slot = location
+        page_data, page_num, num_records, bitmap = self._load_page(type_name, page_number)
         
-        return None
+        record_offset = 12 + slot * self.catalog[type_name]['record_size'] # Calculate the offset of the record (12 bytes for the header)
+        return self._deserialize_record(type_name, page_data, record_offset)
     
     def search_record(self, type_name: str, primary_key: str) -> Optional[List[str]]:
         # Search for a record by primary key
@@ -399,45 +483,93 @@ class DuneArchive:
         if type_name not in self.catalog:
             return False
         
-        type_info = self.catalog[type_name]
-        primary_key_index = type_info['primary_key_order'] - 1
+        location = self._get_pk_index(type_name).pop(primary_key, None)
+        if location is None:
+            return False
         
-        # Search through all pages
-        page_number = 0
-        while page_number < self.MAX_PAGES_PER_FILE:
-            page_data, num_records, bitmap = self._load_page(type_name, page_number)
-            
-            if page_data is None or num_records == 0:
-                page_number += 1
-                continue
-            
-            page_data = bytearray(page_data)
-            
-            # Check each slot
-            for slot in range(self.MAX_RECORDS_PER_PAGE):
-                if bitmap & (1 << slot):  # If the slot is not occupied (bitmap is a bitmask)
-                    record_offset = 12 + slot * type_info['record_size'] # Calculate the offset of the record (12 bytes for the header)
-                    record_data = page_data[record_offset:record_offset + type_info['record_size']]
-                    
-                    values = self._deserialize_record(type_name, record_data)
-                    if values and values[primary_key_index] == primary_key:
-                        # Mark record as invalid
-                        page_data[record_offset] = 0  # Set validity flag to 0
-                        
-                        # Update bitmap and header
-                        bitmap = bitmap & ~(1 << slot)  # Set the bit at the slot to 0
-                        num_records -= 1
-                        header = self._create_page_header(page_number, num_records, bitmap)
-                        page_data[:12] = header
-                        
-                        # Save page
-                        self._save_page(type_name, page_number, bytes(page_data))
-                        return True
-            
-            page_number += 1
+        page_number, slot = location
+        page_data, page_num, num_records, bitmap = self._load_page(type_name, page_number)
+        
+        # Mark record as invalid
+        record_offset = 12 + slot * self.catalog[type_name]['record_size'] # Calculate the offset of the record (12 bytes for the header)
+        page_data[record_offset] = 0  # Set validity flag to 0
+        
+        # Update bitmap and header
+        bitmap = bitmap & ~(1 << slot)  # Set the bit at the slot to 0
+        num_records -= 1
+        _HDR.pack_into(page_data, 0, page_number, num_records, bitmap)
+        heapq.heappush(self._free_slots[type_name], location)
+        return True
+
+def handle_create_type(archive: DuneArchive, parts: List[str], out_f: TextIO) -> bool:
+    # create type <type-name> <number-of-fields> <primary-key-order> <field1-name> <field1-type> ...
+    if len(parts) < 5:  # Not enough parameters for type creation
+        return False
+    try:
+        type_name = parts[2]
+        num_fields = int(parts[3])
+        primary_key_order = int(parts[4])
+        field_specs = parts[5:]
+        
+        if len(field_specs) != 2 * num_fields:  # Invalid number of field specifications
+            return False
         
+        return archive.create_type(type_name, num_fields, primary_key_order, field_specs)
+    except (ValueError, IndexError):
         return False
 
+def handle_create_record(archive: DuneArchive, parts: List[str], out_f: TextIO) -> bool:
+    # create record <type-name> <field1-value> <field2-value> ...
+    if len(parts) < 3:  # Not enough parameters for record creation
+        return False
+    type_name = parts[2]
+    values = parts[3:]
+    
+    type_info = archive.catalog.get(type_name)
+    if type_info is None:  # Type doesn't exist
+        return False
+    
+    if len(values) != len(type_info['fields']):  # Wrong number of values
+        return False
+    
+    return archive.create_record(type_name, values)
+
+def handle_search_record(archive: DuneArchive, parts: List[str], out_f: TextIO) -> bool:
+    # search record <type-name> <primary-key>
+    if len(parts) != 4:  # Wrong number of parameters for search
+        return False
+    
+    type_name = parts[2]
+    if type_name not in archive.catalog:  # Type doesn't exist
+        return False
+    
+    result = archive.search_record(type_name, parts[3])
+    if result is None:
+        return False
+    
+    # Write result to output file
+    out_f.write(' '.join(result) + '\n')
+    return True
+
+def handle_delete_record(archive: DuneArchive, parts: List[str], out_f: TextIO) -> bool:
+    # delete record <type-name> <primary-key>
+    if len(parts) != 4:  # Wrong number of parameters for delete
+        return False
+    
+    type_name = parts[2]
+    if type_name not in archive.catalog:  # Type doesn't exist
+        return False
+    
+    return archive.delete_record(type_name, parts[3])
+
+# Command handlers by (operation type, operation)
+HANDLERS = {
+    ('create', 'type'): handle_create_type,
+    ('create', 'record'): handle_create_record,
+    ('search', 'record'): handle_search_record,
+    ('delete', 'record'): handle_delete_record,
+}
+
 def main():
     if len(sys.argv) != 2:
         print("Usage: python3 archive.py <input_file_path>")
@@ -445,113 +577,35 @@ def main():
     
     input_file_path = sys.argv[1]
     archive = DuneArchive()
-    
-    # Clear output file
-    with open('output.txt', 'w') as f:
-        pass
+    log = archive._log_operation
     
     try:
-        with open(input_file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                parts = line.split()
-                if len(parts) < 2:  # Invalid command format
-                    archive._log_operation(line, False)
-                    continue
-                
-                operation_type = parts[0]
-                operation = parts[1]
-                
-                # Handle create operations
-                if operation_type == 'create':
-                    if operation == 'type':
-                        if len(parts) < 5:  # Not enough parameters for type creation
-                            archive._log_operation(line, False)
-                            continue
-                        try:
-                            type_name = parts[2]
-                            num_fields = int(parts[3])
-                            primary_key_order = int(parts[4])
-                            field_specs = parts[5:]
-                            
-                            if len(field_specs) != 2 * num_fields:  # Invalid number of field specifications
-                                archive._log_operation(line, False)
-                                continue
-                            
-                            success = archive.create_type(type_name, num_fields, primary_key_order, field_specs)
-                            archive._log_operation(line, success)
-                        except (ValueError, IndexError):
-                            archive._log_operation(line, False)
-                            continue
-                            
-                    elif operation == 'record':
-                        if len(parts) < 3:  # Not enough parameters for record creation
-                            archive._log_operation(line, False)
+        # Clear output file and keep it open for the search results
+        with open('output.txt', 'w') as out_f:
+            try:
+                with open(input_file_path, 'r') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
                             continue
-                        type_name = parts[2]
-                        values = parts[3:]
                         
-                        if type_name not in archive.catalog:  # Type doesn't exist
-                            archive._log_operation(line, False)
+                        parts = line.split()
+                        if len(parts) < 2:  # Invalid command format
+                            log(line, False)
                             continue
-                            
-                        if len(values) != len(archive.catalog[type_name]['fields']):  # Wrong number of values
-                            archive._log_operation(line, False)
-                            continue
-                            
-                        success = archive.create_record(type_name, values)
-                        archive._log_operation(line, success)
-                    else:
-                        archive._log_operation(line, False)  # Invalid create operation
-                
-                # Handle search operation
-                elif operation_type == 'search' and operation == 'record':
-                    if len(parts) != 4:  # Wrong number of parameters for search
-                        archive._log_operation(line, False)
-                        continue
                         
-                    type_name = parts[2]
-                    primary_key = parts[3]
-                    
-                    if type_name not in archive.catalog:  # Type doesn't exist
-                        archive._log_operation(line, False)
-                        continue
-                    
-                    result = archive.search_record(type_name, primary_key)
-                    success = result is not None
-                    
-                    if success:
-                        # Write result to output file
-                        with open('output.txt', 'a') as out_f:
-                            out_f.write(' '.join(result) + '\n')
-                    
-                    archive._log_operation(line, success)
-                
-                # Handle delete operation
-                elif operation_type == 'delete' and operation == 'record':
-                    if len(parts) != 4:  # Wrong number of parameters for delete
-                        archive._log_operation(line, False)
-                        continue
+                        handler = HANDLERS.get((parts[0], parts[1]))
+                        if handler is None:  # Invalid operation
+                            log(line, False)
+                            continue
                         
-                    type_name = parts[2]
-                    primary_key = parts[3]
-                    
-                    if type_name not in archive.catalog:  # Type doesn't exist
-                        archive._log_operation(line, False)
-                        continue
-                    
-                    success = archive.delete_record(type_name, primary_key)
-                    archive._log_operation(line, success)
-                
-                # Handle invalid operation type
-                else:
-                    archive._log_operation(line, False)
-    
-    except Exception as e:
-        print(f"Error processing input file: {e}")
+                        log(line, handler(archive, parts, out_f))
+            
+            except Exception as e:
+                print(f"Error processing input file: {e}")
+    finally:
+        # Always flush the log and data files, even if output.txt could not be opened
+        archive.close()
 
 if __name__ == "__main__":
     main()